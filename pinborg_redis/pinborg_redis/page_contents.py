@@ -0,0 +1,124 @@
+import hashlib
+import pathlib
+import zstandard
+
+# The page contents are stored zstd-compressed in the PAGE_CONTENT table,
+# optionally with a shared dictionary (trained e.g. with `zstd --train`) that
+# helps a lot with small pages. The dictionaries themselves are stored in the
+# ZSTD_DICTIONARY table and every blob records the id of the dictionary it was
+# compressed with (0 for none), so that it stays readable when the
+# ZSTD_DICTIONARY_PATH setting changes.
+NO_ZSTD_DICTIONARY_ID = 0
+
+def hash_page_content(page_content):
+    """Returns the key of a page content in the PAGE_CONTENT table.
+
+    Parameters
+    ----------
+    page_content : The utf-8 encoded content of a page (bytes)
+
+    Returns
+    -------
+        The raw sha256 digest (32 bytes) of the content
+    """
+
+    return hashlib.sha256(page_content).digest()
+
+def load_zstd_dictionary(zstd_dictionary_path, zstd_compression_level):
+    """Loads a zstd dictionary from a file. Only full zstd dictionaries (with
+    header and id) are accepted: a raw content dictionary has the id 0, so the
+    blobs compressed with it could not be told apart from the ones compressed
+    without one.
+
+    Parameters
+    ----------
+    zstd_dictionary_path : The path of the dictionary file
+    zstd_compression_level : The level the dictionary will be used with
+
+    Returns
+    -------
+        A zstandard.ZstdCompressionDict
+    """
+
+    try:
+        zstd_dictionary = zstandard.ZstdCompressionDict(
+            pathlib.Path(zstd_dictionary_path).read_bytes(),
+            dict_type=zstandard.DICT_TYPE_FULLDICT)
+        zstd_dictionary.precompute_compress(level=zstd_compression_level)
+    except zstandard.ZstdError as e:
+        raise ValueError(f'''{zstd_dictionary_path} is not a valid zstd
+         dictionary: {e}''')
+
+    if zstd_dictionary.dict_id() == NO_ZSTD_DICTIONARY_ID:
+        raise ValueError(f'''{zstd_dictionary_path} is a zstd dictionary
+         without id (train it with `zstd --train`).''')
+
+    return zstd_dictionary
+
+class PageContentReader:
+    """Reads the page contents stored by the PinborgPostgresPipeline. Only
+    needs an open connection to the pinborg database.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+        # One decompressor per dictionary id, the dictionaries are fetched
+        # from the ZSTD_DICTIONARY table when they are first needed
+        self.decompressors = {NO_ZSTD_DICTIONARY_ID: zstandard.ZstdDecompressor()}
+
+    def _get_decompressor(self, zstd_dictionary_id):
+        if zstd_dictionary_id not in self.decompressors:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                'SELECT data FROM ZSTD_DICTIONARY WHERE dict_id = %s;',
+                (zstd_dictionary_id,))
+            row = cursor.fetchone()
+            cursor.close()
+
+            if row is None:
+                raise ValueError(f'''The zstd dictionary {zstd_dictionary_id}
+                 is not stored in the ZSTD_DICTIONARY table.''')
+
+            zstd_dictionary = zstandard.ZstdCompressionDict(
+                bytes(row[0]), dict_type=zstandard.DICT_TYPE_FULLDICT)
+            self.decompressors[zstd_dictionary_id] = zstandard.ZstdDecompressor(
+                dict_data=zstd_dictionary)
+
+        return self.decompressors[zstd_dictionary_id]
+
+    def decompress(self, content, zstd_dictionary_id):
+        """Returns the text of a blob of the PAGE_CONTENT table.
+
+        Parameters
+        ----------
+        content : The compressed content (bytes or memoryview)
+        zstd_dictionary_id : The id of the dictionary it was compressed with
+
+        Returns
+        -------
+            The text of the page
+        """
+
+        decompressor = self._get_decompressor(zstd_dictionary_id)
+
+        return decompressor.decompress(bytes(content)).decode('utf-8')
+
+    def get_page_content(self, page_url_slug):
+        """Returns the text content of the page with the given url slug, or
+        None if the page has not been stored.
+        """
+
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT PAGE_CONTENT.content, PAGE_CONTENT.zstd_dictionary_id
+            FROM PAGE JOIN PAGE_CONTENT ON PAGE.page_content_hash = PAGE_CONTENT.content_hash
+            WHERE PAGE.page_url_slug = %s;""",
+            (page_url_slug,))
+        row = cursor.fetchone()
+        cursor.close()
+
+        if row is None:
+            return None
+
+        return self.decompress(*row)
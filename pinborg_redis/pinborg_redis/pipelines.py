@@ -6,10 +6,14 @@
 import json
 import pathlib
 import psycopg2
+import zstandard
 
 from datetime import datetime
 from itemadapter import ItemAdapter
+from pinborg_redis.page_contents import (NO_ZSTD_DICTIONARY_ID, hash_page_content,
+                                         load_zstd_dictionary)
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_values
 
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
 DATETIME2_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
@@ -18,6 +22,11 @@ DEFAULT_PINS_FOLDER = './parsed/pins'
 DEFAULT_URLSLUGS_FOLDER = './parsed/urlslugs'
 DEFAULT_PAGES_FOLDER = './parsed/pages'
 
+DEFAULT_ZSTD_COMPRESSION_LEVEL = 3
+
+# Number of PAGE rows migrated to PAGE_CONTENT per round trip
+PAGE_MIGRATION_BATCH_SIZE = 500
+
 def get_item_type(item):
     return type(item).__name__.replace('Item', '').lower()  # PinItem => pin
 
@@ -63,7 +72,9 @@ class PinborgJsonPipeline:
     
 class PinborgPostgresPipeline:
     def __init__(self, db_hostname='localhost', db_username='notiv', 
-                 db_password='', database='pinborg'):
+                 db_password='', database='pinborg',
+                 zstd_compression_level=DEFAULT_ZSTD_COMPRESSION_LEVEL,
+                 zstd_dictionary_path=None):
         # Connection details
         self.hostname = db_hostname
         self.db_username = db_username
@@ -71,6 +82,17 @@ class PinborgPostgresPipeline:
         self.default_admin_database = 'postgres'
         self.database = database
 
+        # The page contents are stored zstd-compressed, optionally with a
+        # shared dictionary (see page_contents.py)
+        self.zstd_dictionary = None
+        self.zstd_dictionary_id = NO_ZSTD_DICTIONARY_ID
+        if zstd_dictionary_path:
+            self.zstd_dictionary = load_zstd_dictionary(
+                zstd_dictionary_path, zstd_compression_level)
+            self.zstd_dictionary_id = self.zstd_dictionary.dict_id()
+        self.compressor = zstandard.ZstdCompressor(
+            level=zstd_compression_level, dict_data=self.zstd_dictionary)
+
         if not self._check_if_database_exists(self.database):
             self._create_database(self.database)
 
@@ -91,9 +113,32 @@ class PinborgPostgresPipeline:
         if not self._check_if_table_exists('URLSLUG'):
             self._create_urlslug_table()
 
+        if not self._check_if_table_exists('ZSTD_DICTIONARY'):
+            self._create_zstd_dictionary_table()
+
+        # PAGE references PAGE_CONTENT, so the latter must be created first
+        if not self._check_if_table_exists('PAGE_CONTENT'):
+            self._create_page_content_table()
+
         if not self._check_if_table_exists('PAGE'):
             self._create_page_table()
 
+        if self.zstd_dictionary:
+            self._insert_into_zstd_dictionary_table()
+
+        # PAGE tables created before PAGE_CONTENT existed still store the
+        # text in the page_content column
+        if self._check_if_column_exists('PAGE', 'page_content'):
+            self._migrate_page_table()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            zstd_compression_level=crawler.settings.getint(
+                'ZSTD_COMPRESSION_LEVEL', DEFAULT_ZSTD_COMPRESSION_LEVEL),
+            zstd_dictionary_path=crawler.settings.get('ZSTD_DICTIONARY_PATH')
+        )
+
     def _check_if_database_exists(self, database):
         # NOTE: The connection and the cursor are temporary (try to access
         # the default_admin_database). Outside this function we connect to
@@ -161,15 +206,18 @@ class PinborgPostgresPipeline:
 
     def _check_if_table_exists(self, table_name):
 
-        # Query the list of tables
-        self.cursor.execute('SELECT table_name FROM information_schema.tables;')
+        # Query the list of tables (unquoted identifiers are stored in lower
+        # case)
+        self.cursor.execute("""
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = current_schema();""")
 
         # Fetch all the rows
         rows = self.cursor.fetchall()
 
         # Check if the table exists
         table_exists = False
-        if (table_name,) in rows:
+        if (table_name.lower(),) in rows:
             table_exists = True
             print(f'The {table_name} table exists.')
         else:
@@ -177,6 +225,16 @@ class PinborgPostgresPipeline:
 
         return table_exists
     
+    def _check_if_column_exists(self, table_name, column_name):
+
+        # Unquoted identifiers are stored in lower case
+        self.cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s;""",
+            (table_name.lower(), column_name.lower()))
+
+        return self.cursor.fetchone() is not None
+
     def _create_pin_table(self):
 
         self.cursor.execute("""
@@ -219,6 +277,44 @@ class PinborgPostgresPipeline:
         # Commit, close the cursor and the connection
         self.connection.commit()
 
+    def _create_zstd_dictionary_table(self):
+
+        # The dictionaries the page contents have been compressed with, so
+        # that the contents stay readable when the dictionary is changed
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ZSTD_DICTIONARY(
+                dict_id bigint PRIMARY KEY,
+                data bytea
+            );
+            """
+        )
+
+        # Commit, close the cursor and the connection
+        self.connection.commit()
+
+    def _create_page_content_table(self):
+
+        # Content-addressed store of the (compressed) page contents: pages
+        # with the same text share a single row. The content_hash is the raw
+        # sha256 digest of the text and the sizes are kept only here, as
+        # they depend on the content and not on the page.
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS PAGE_CONTENT(
+                content_hash bytea PRIMARY KEY,
+                content bytea,
+                content_size integer,
+                content_compressed_size integer,
+                zstd_dictionary_id bigint
+            );
+
+            -- The content is already compressed, don't let TOAST try again
+            ALTER TABLE PAGE_CONTENT ALTER COLUMN content SET STORAGE EXTERNAL;
+            """
+        )
+
+        # Commit, close the cursor and the connection
+        self.connection.commit()
+
     def _create_page_table(self):
 
         self.cursor.execute("""
@@ -227,8 +323,7 @@ class PinborgPostgresPipeline:
                 page_url text,
                 page_fetch_date timestamp,
                 page_code text,
-                page_content text,
-                page_content_size integer
+                page_content_hash bytea REFERENCES PAGE_CONTENT (content_hash)
             );
 
             CREATE INDEX IF NOT EXISTS page_url_slug ON PAGE (page_url_slug);
@@ -302,19 +397,139 @@ class PinborgPostgresPipeline:
         
         self.connection.commit()
 
+    def _insert_into_zstd_dictionary_table(self):
+        self.cursor.execute("""
+            INSERT INTO ZSTD_DICTIONARY(dict_id, data)
+            VALUES(%s, %s)
+            ON CONFLICT (dict_id) DO NOTHING;""",
+            (self.zstd_dictionary_id, psycopg2.Binary(self.zstd_dictionary.as_bytes())))
+
+        self.connection.commit()
+
     def _insert_into_page_table(self, item):
         page_url_slug = item['page_url_slug']
+
+        # Pages are never updated, so don't compress and send the content
+        # of a page that is already stored
+        self.cursor.execute(
+            'SELECT 1 FROM PAGE WHERE page_url_slug = %s;', (page_url_slug,))
+        if self.cursor.fetchone() is not None:
+            self.connection.commit()
+            return
+
         page_url = item['page_url']
         page_fetch_date = datetime.strptime(item['page_fetch_date'], DATETIME2_FORMAT)
         page_code = item['page_code']
-        page_content = item['page_content']
-        page_content_size = item['page_content_size']
+        page_content_hash = self._insert_into_page_content_table(item['page_content'])
 
         self.cursor.execute(f"""
             INSERT INTO PAGE(
-                page_url_slug, page_url, page_fetch_date, page_code, page_content, page_content_size)
-            VALUES(%s, %s, %s, %s, %s, %s)
+                page_url_slug, page_url, page_fetch_date, page_code, page_content_hash)
+            VALUES(%s, %s, %s, %s, %s)
             ON CONFLICT (page_url_slug) DO NOTHING;""",
-            (page_url_slug, page_url, page_fetch_date, page_code, page_content, page_content_size))
+            (page_url_slug, page_url, page_fetch_date, page_code, page_content_hash))
         
         self.connection.commit()
+
+    def _get_page_content_row(self, content_hash, page_content):
+        # The PAGE_CONTENT row of the (utf-8 encoded) page_content. The sizes
+        # are computed from the stored bytes, not taken from the item.
+        content = self.compressor.compress(page_content)
+
+        return (psycopg2.Binary(content_hash), psycopg2.Binary(content),
+                len(page_content), len(content), self.zstd_dictionary_id)
+
+    def _insert_into_page_content_table(self, page_content):
+        # Stores the page_content (if it is not stored yet) and returns its
+        # hash. The caller commits.
+        page_content = (page_content or '').encode('utf-8')
+        content_hash = hash_page_content(page_content)
+
+        # Look up the hash first, so that contents that are already stored
+        # are neither compressed nor sent to the database again
+        self.cursor.execute(
+            'SELECT 1 FROM PAGE_CONTENT WHERE content_hash = %s;',
+            (psycopg2.Binary(content_hash),))
+        if self.cursor.fetchone() is None:
+            # ON CONFLICT: another crawler may have stored the same content
+            # since the lookup above, in which case its row is kept
+            self.cursor.execute(f"""
+                INSERT INTO PAGE_CONTENT(
+                    content_hash, content, content_size, content_compressed_size, zstd_dictionary_id)
+                VALUES(%s, %s, %s, %s, %s)
+                ON CONFLICT (content_hash) DO NOTHING;""",
+                self._get_page_content_row(content_hash, page_content))
+
+        return psycopg2.Binary(content_hash)
+
+    def _migrate_page_table(self):
+        # Moves the texts of the page_content column into PAGE_CONTENT and
+        # drops the old page_content and page_content_size columns. Runs in
+        # a single transaction, so a failed migration leaves PAGE untouched.
+
+        # Crawlers that start at the same time wait here for the one that
+        # migrates, and then find nothing left to migrate
+        self.cursor.execute('LOCK TABLE PAGE IN ACCESS EXCLUSIVE MODE;')
+        if not self._check_if_column_exists('PAGE', 'page_content'):
+            self.connection.commit()
+            return
+
+        print('Migrating the page contents of the PAGE table to PAGE_CONTENT.')
+
+        self.cursor.execute("""
+            ALTER TABLE PAGE ADD COLUMN IF NOT EXISTS
+                page_content_hash bytea REFERENCES PAGE_CONTENT (content_hash);""")
+
+        # A server-side cursor, so that the texts are not all loaded at once
+        page_cursor = self.connection.cursor(name='page_migration')
+        page_cursor.execute('SELECT page_url_slug, page_content FROM PAGE;')
+        while True:
+            rows = page_cursor.fetchmany(PAGE_MIGRATION_BATCH_SIZE)
+            if not rows:
+                break
+            self._migrate_page_rows(rows)
+        page_cursor.close()
+
+        self.cursor.execute("""
+            ALTER TABLE PAGE DROP COLUMN page_content;
+            ALTER TABLE PAGE DROP COLUMN IF EXISTS page_content_size;""")
+
+        self.connection.commit()
+
+        # DROP COLUMN only hides the old texts, rewrite PAGE to free their
+        # space. VACUUM cannot run inside a transaction.
+        print('Rewriting the PAGE table to free the space of the old page contents.')
+        self.connection.autocommit = True
+        self.cursor.execute('VACUUM FULL PAGE;')
+        self.connection.autocommit = False
+
+    def _migrate_page_rows(self, rows):
+        page_contents = {}
+        page_content_hashes = []
+        for page_url_slug, page_content in rows:
+            page_content = (page_content or '').encode('utf-8')
+            content_hash = hash_page_content(page_content)
+            page_contents[content_hash] = page_content
+            page_content_hashes.append((page_url_slug, psycopg2.Binary(content_hash)))
+
+        # Only compress and send the contents that are not stored yet
+        self.cursor.execute(
+            'SELECT content_hash FROM PAGE_CONTENT WHERE content_hash = ANY(%s);',
+            ([psycopg2.Binary(content_hash) for content_hash in page_contents],))
+        for (content_hash,) in self.cursor.fetchall():
+            del page_contents[bytes(content_hash)]
+
+        if page_contents:
+            execute_values(self.cursor, """
+                INSERT INTO PAGE_CONTENT(
+                    content_hash, content, content_size, content_compressed_size, zstd_dictionary_id)
+                VALUES %s
+                ON CONFLICT (content_hash) DO NOTHING;""",
+                [self._get_page_content_row(content_hash, page_content)
+                 for content_hash, page_content in page_contents.items()])
+
+        execute_values(self.cursor, """
+            UPDATE PAGE SET page_content_hash = migrated.page_content_hash
+            FROM (VALUES %s) AS migrated(page_url_slug, page_content_hash)
+            WHERE PAGE.page_url_slug = migrated.page_url_slug;""",
+            page_content_hashes, page_size=PAGE_MIGRATION_BATCH_SIZE)
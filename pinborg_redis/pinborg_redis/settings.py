@@ -96,3 +96,9 @@ DOWNLOAD_DELAY = 1
 
 STATS_KEY = 'pinborg_redis:stats'
 STATS_CLASS = 'scrapy_redis.stats.RedisStatsCollector'
+
+# Compression of the page contents stored in the PAGE_CONTENT table.
+# Optionally, a shared zstd dictionary (e.g. trained with `zstd --train` on a
+# sample of pages) can be used to compress small pages better.
+ZSTD_COMPRESSION_LEVEL = 3
+# ZSTD_DICTIONARY_PATH = './pages.zstd_dict'
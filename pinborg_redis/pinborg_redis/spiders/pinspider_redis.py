@@ -3,7 +3,6 @@ import datetime
 import json
 import math
 import re
-import sys
 
 
 from bs4 import BeautifulSoup
@@ -134,15 +133,15 @@ class PinSpider(RedisSpider):
         external_page['page_fetch_date'] = datetime.datetime.utcnow().isoformat()
         external_page['page_code'] = response.status
         external_page['page_content'] = ''
-        external_page['page_content_size'] = 0
 
         if response.url[-4:] == '.pdf':
             external_page['page_content'] = utils.parse_pdf(response)
-            external_page['page_content_size'] = sys.getsizeof(external_page['page_content'])
         elif response.body:
-            external_page['page_content'] = utils.parse_html(response)
-            external_page['page_content_size'] = sys.getsizeof(external_page['page_content'])
+            # extract() returns None when it cannot find any text
+            external_page['page_content'] = utils.parse_html(response) or ''
         else:
             self.logger.info(f'[PINBORG] No response body.')
 
+        external_page['page_content_size'] = utils.get_content_size(external_page['page_content'])
+
         yield external_page
\ No newline at end of file
@@ -47,3 +47,17 @@ def parse_html(response):
     text = extract(response.body)
 
     return text
+
+def get_content_size(content):
+    """Returns the size of the content in bytes (utf-8 encoded).
+
+    Parameters
+    ----------
+    content : A string with the content of a page (or None)
+
+    Returns
+    -------
+        The number of bytes of the utf-8 encoded content
+    """
+
+    return len((content or '').encode('utf-8'))
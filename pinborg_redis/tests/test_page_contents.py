@@ -0,0 +1,92 @@
+import pytest
+import zstandard
+
+from pinborg_redis.page_contents import (NO_ZSTD_DICTIONARY_ID, PageContentReader,
+                                         hash_page_content, load_zstd_dictionary)
+
+PAGE_CONTENT = 'Pinboard is a bookmarking website for introverted people in a hurry. ' * 20
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.row = None
+
+    def execute(self, query, params):
+        self.connection.queries.append((query, params))
+        dict_id = params[0]
+        self.row = (self.connection.dictionaries[dict_id],) \
+            if dict_id in self.connection.dictionaries else None
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Only answers the ZSTD_DICTIONARY lookups of the PageContentReader."""
+
+    def __init__(self, dictionaries=None):
+        self.dictionaries = dictionaries or {}
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+@pytest.fixture
+def zstd_dictionary_path(tmp_path):
+    samples = [
+        f'Page {i}: a bookmark about {topic} saved by user {i % 7}.'.encode('utf-8')
+        for i in range(1000)
+        for topic in ('python', 'postgres', 'scrapy', 'redis')
+    ]
+    path = tmp_path / 'pages.zstd_dict'
+    path.write_bytes(zstandard.train_dictionary(2048, samples).as_bytes())
+
+    return path
+
+def test_hash_page_content_is_raw_sha256_digest():
+    assert len(hash_page_content(PAGE_CONTENT.encode('utf-8'))) == 32
+
+def test_round_trip_without_dictionary():
+    connection = FakeConnection()
+    content = zstandard.ZstdCompressor(level=3).compress(PAGE_CONTENT.encode('utf-8'))
+
+    reader = PageContentReader(connection)
+
+    assert reader.decompress(memoryview(content), NO_ZSTD_DICTIONARY_ID) == PAGE_CONTENT
+    assert connection.queries == []
+
+def test_round_trip_with_dictionary(zstd_dictionary_path):
+    zstd_dictionary = load_zstd_dictionary(zstd_dictionary_path, 3)
+    dict_id = zstd_dictionary.dict_id()
+    connection = FakeConnection({dict_id: memoryview(zstd_dictionary.as_bytes())})
+    content = zstandard.ZstdCompressor(
+        level=3, dict_data=zstd_dictionary).compress(PAGE_CONTENT.encode('utf-8'))
+
+    reader = PageContentReader(connection)
+
+    assert reader.decompress(content, dict_id) == PAGE_CONTENT
+    assert reader.decompress(content, dict_id) == PAGE_CONTENT
+    # The dictionary is only fetched once
+    assert len(connection.queries) == 1
+
+def test_round_trip_of_empty_page():
+    content = zstandard.ZstdCompressor(level=3).compress(b'')
+
+    reader = PageContentReader(FakeConnection())
+
+    assert reader.decompress(content, NO_ZSTD_DICTIONARY_ID) == ''
+
+def test_decompress_with_unknown_dictionary():
+    reader = PageContentReader(FakeConnection())
+
+    with pytest.raises(ValueError):
+        reader.decompress(b'', 1234)
+
+def test_load_zstd_dictionary_rejects_raw_content(tmp_path):
+    path = tmp_path / 'raw.dict'
+    path.write_bytes(PAGE_CONTENT.encode('utf-8'))
+
+    with pytest.raises(ValueError):
+        load_zstd_dictionary(path, 3)